@@ -1,6 +1,8 @@
+import threading
 from abc import ABC, abstractmethod
 
 import torch
+from torch.ao.quantization import quantize_dynamic
 from transformers import AutoModelForTokenClassification, AutoTokenizer
 
 from lettucedetect.datasets.hallucination_dataset import HallucinationDataset
@@ -20,6 +22,28 @@ Summarize the following text:
 output:
 """
 
+# Sequence lengths and batch sizes the inputs of a compiled model are padded
+# to, to avoid a recompilation of the model for every new input shape.
+SEQUENCE_LENGTH_BUCKETS = (128, 256, 512, 1024, 2048)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+
+
+def _resolve_dtype(dtype: torch.dtype | str, device: torch.device) -> torch.dtype:
+    """Resolve a dtype name like "bfloat16" or "auto" to a torch dtype.
+
+    "auto" selects bfloat16 on GPUs which support it, float16 on other GPUs and
+    float32 on the CPU.
+    """
+    if isinstance(dtype, torch.dtype):
+        return dtype
+    if dtype == "auto":
+        if torch.device(device).type != "cuda":
+            return torch.float32
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    if dtype not in ("float32", "float16", "bfloat16"):
+        raise ValueError("Invalid dtype. Use 'auto', 'float32', 'float16' or 'bfloat16'.")
+    return getattr(torch, dtype)
+
 
 class BaseDetector(ABC):
     @abstractmethod
@@ -34,19 +58,45 @@ class BaseDetector(ABC):
 
 
 class TransformerDetector(BaseDetector):
-    def __init__(self, model_path: str, max_length: int = 4096, device=None, **kwargs):
+    def __init__(
+        self,
+        model_path: str,
+        max_length: int = 4096,
+        device=None,
+        dtype: torch.dtype | str | None = None,
+        quantize: bool = False,
+        compile: bool = False,
+        **kwargs,
+    ):
         """Initialize the TransformerDetector.
 
         :param model_path: The path to the model.
         :param max_length: The maximum length of the input sequence.
         :param device: The device to run the model on.
+        :param dtype: The dtype to run the model in, e.g. "bfloat16", or "auto" to pick one for the device.
+        :param quantize: Apply dynamic int8 quantization to the linear layers (CPU and float32 only).
+        :param compile: Compile the model with `torch.compile`, see `warmup`.
         """
         self.tokenizer = AutoTokenizer.from_pretrained(model_path, **kwargs)
+        # The truncation settings of fast tokenizers are shared state, see `_tokenize`.
+        self._tokenizer_lock = threading.Lock()
         self.model = AutoModelForTokenClassification.from_pretrained(model_path, **kwargs)
         self.max_length = max_length
         self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
+        if dtype is None:
+            self.model.to(self.device)
+        else:
+            self.model.to(device=self.device, dtype=_resolve_dtype(dtype, self.device))
+        if quantize:
+            if torch.device(self.device).type != "cpu":
+                raise ValueError("Quantization is only supported on the CPU.")
+            if dtype is not None and _resolve_dtype(dtype, self.device) != torch.float32:
+                raise ValueError("Quantization is only supported with float32.")
+            self.model = quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
         self.model.eval()
+        self.compiled = compile
+        if compile:
+            self.model = torch.compile(self.model, mode="reduce-overhead", fullgraph=False)
 
     def _form_prompt(self, context: list[str], question: str | None) -> str:
         """Form a prompt from the provided context and question. We use different prompts for summary and QA tasks.
@@ -65,37 +115,121 @@ class TransformerDetector(BaseDetector):
                 question=question, num_passages=len(context), context=context_str
             )
 
-    def _predict(self, context: str, answer: str, output_format: str = "tokens") -> list:
-        """Predict hallucination tokens or spans from the provided context and answer.
+    def _tokenize(self, context: str, answer: str) -> dict:
+        """Tokenize a single context and answer pair for inference.
 
         :param context: The context string.
         :param answer: The answer string.
-        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        :return: A dict with the 1D `input_ids` and `attention_mask` tensors, the
+                 token `offsets`, the `answer_start_token` index and the `answer`.
         """
-        # Use the shared tokenization logic from RagTruthDataset
-        encoding, labels, offsets, answer_start_token = (
-            HallucinationDataset.prepare_tokenized_input(
+        # Use the shared tokenization logic from RagTruthDataset. It changes the
+        # truncation settings of the tokenizer between its two tokenizer calls,
+        # so concurrent calls from several threads have to be serialized.
+        with self._tokenizer_lock:
+            encoding, _, offsets, answer_start_token = HallucinationDataset.prepare_tokenized_input(
                 self.tokenizer, context, answer, self.max_length
             )
-        )
+        return {
+            "input_ids": encoding["input_ids"][0],
+            "attention_mask": encoding["attention_mask"][0],
+            "offsets": offsets,
+            "answer_start_token": answer_start_token,
+            "answer": answer,
+        }
 
-        # Create a label tensor: mark tokens before answer as -100 (ignored) and answer tokens as 0.
-        labels = torch.full_like(encoding.input_ids[0], -100, device=self.device)
-        labels[answer_start_token:] = 0
-        # Move encoding to the device
+    def _forward(self, encodings: list[dict]) -> list[torch.Tensor]:
+        """Run the model on a batch of tokenized inputs.
+
+        The inputs are right-padded to the longest sequence of the batch, see
+        `_padded_length`. Batches of compiled models are additionally padded
+        with dummy inputs to the batch sizes in `BATCH_SIZE_BUCKETS`.
+
+        :param encodings: A list of encodings as returned by `_tokenize`.
+        :return: A list with the class probabilities (shape [seq_length, 2]) of
+                 each input, without padding, on the CPU.
+        """
+        lengths = [encoding["input_ids"].size(0) for encoding in encodings]
+        padded_length = self._padded_length(max(lengths))
+        batch_size = self._padded_batch_size(len(encodings))
+        pad_token_id = self.tokenizer.pad_token_id or 0
+        input_ids = torch.full((batch_size, padded_length), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((batch_size, padded_length), dtype=torch.long)
+        # The dummy inputs attend to a single padding token, a fully masked
+        # input can result in NaNs in the attention.
+        attention_mask[len(encodings) :, 0] = 1
+        for i, encoding in enumerate(encodings):
+            input_ids[i, : lengths[i]] = encoding["input_ids"]
+            attention_mask[i, : lengths[i]] = encoding["attention_mask"]
+
+        # Run model inference
+        with torch.inference_mode():
+            outputs = self.model(
+                input_ids=input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
+            )
+        probabilities = torch.softmax(outputs.logits.float(), dim=-1).cpu()
+        return [probabilities[i, :length] for i, length in enumerate(lengths)]
+
+    def _padded_length(self, length: int) -> int:
+        """Return the sequence length a batch with inputs of up to `length` tokens is padded to.
+
+        Compiled models are padded to the smallest bucket of
+        `SEQUENCE_LENGTH_BUCKETS` which fits the inputs, with `max_length` as
+        the last bucket. Otherwise the inputs are padded to a multiple of 8, so
+        the shapes of the matrix multiplications suit the GPU tensor cores.
+        """
+        if self.compiled:
+            for bucket in (*SEQUENCE_LENGTH_BUCKETS, self.max_length):
+                if bucket >= length:
+                    return max(min(bucket, self.max_length), length)
+        return max(min(-(-length // 8) * 8, self.max_length), length)
+
+    def _padded_batch_size(self, batch_size: int) -> int:
+        """Return the batch size a batch with `batch_size` inputs is padded to.
+
+        Compiled models are padded to the smallest bucket of
+        `BATCH_SIZE_BUCKETS` which fits the batch, otherwise the batch is not
+        padded.
+        """
+        if self.compiled:
+            for bucket in BATCH_SIZE_BUCKETS:
+                if bucket >= batch_size:
+                    return bucket
+        return batch_size
+
+    def warmup(self, seq_length: int = 512) -> None:
+        """Run a forward pass with a dummy input.
+
+        Compiles the model if it was created with `compile=True`, so the
+        compilation does not delay the first prediction.
+
+        :param seq_length: The sequence length of the dummy input.
+        """
+        seq_length = min(seq_length, self.max_length)
+        pad_token_id = self.tokenizer.pad_token_id or 0
         encoding = {
-            key: value.to(self.device)
-            for key, value in encoding.items()
-            if key in ["input_ids", "attention_mask", "labels"]
+            "input_ids": torch.full((seq_length,), pad_token_id, dtype=torch.long),
+            "attention_mask": torch.ones(seq_length, dtype=torch.long),
         }
-        labels = torch.tensor(labels, device=self.device)
+        self._forward([encoding])
 
-        # Run model inference
-        with torch.no_grad():
-            outputs = self.model(**encoding)
-        logits = outputs.logits
-        token_preds = torch.argmax(logits, dim=-1)[0]
-        probabilities = torch.softmax(logits, dim=-1)[0]
+    def _decode(self, encoding: dict, probabilities: torch.Tensor, output_format: str) -> list:
+        """Convert the class probabilities of a single input into token or span predictions.
+
+        :param encoding: The encoding as returned by `_tokenize`.
+        :param probabilities: The class probabilities as returned by `_forward`.
+        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        """
+        answer = encoding["answer"]
+        offsets = encoding["offsets"]
+        answer_start_token = encoding["answer_start_token"]
+
+        # Create a label tensor: mark tokens before answer as -100 (ignored) and answer tokens as 0.
+        labels = torch.full_like(encoding["input_ids"], -100)
+        labels[answer_start_token:] = 0
+
+        token_preds = torch.argmax(probabilities, dim=-1)
 
         # Mask out predictions for context tokens.
         token_preds = torch.where(labels == -100, labels, token_preds)
@@ -103,14 +237,16 @@ class TransformerDetector(BaseDetector):
         if output_format == "tokens":
             # return token probabilities for each token (with the tokens as well, if not -100)
             token_probs = []
-            input_ids = encoding["input_ids"][0]  # Get the input_ids tensor from the encoding dict
-            for i, (token, pred, prob) in enumerate(zip(input_ids, token_preds, probabilities)):
+            input_ids = encoding["input_ids"].tolist()
+            for i, (token, pred, prob) in enumerate(
+                zip(input_ids, token_preds.tolist(), probabilities[:, 1].tolist())
+            ):
                 if not labels[i].item() == -100:
                     token_probs.append(
                         {
                             "token": self.tokenizer.decode([token]),
-                            "pred": pred.item(),
-                            "prob": prob[1].item(),  # Get probability for class 1 (hallucination)
+                            "pred": pred,
+                            "prob": prob,  # Probability for class 1 (hallucination)
                         }
                     )
             return token_probs
@@ -174,6 +310,19 @@ class TransformerDetector(BaseDetector):
         else:
             raise ValueError("Invalid output_format. Use 'tokens' or 'spans'.")
 
+    def _predict(self, context: str, answer: str, output_format: str = "tokens") -> list:
+        """Predict hallucination tokens or spans from the provided context and answer.
+
+        :param context: The context string.
+        :param answer: The answer string.
+        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        """
+        if output_format not in ("tokens", "spans"):
+            raise ValueError("Invalid output_format. Use 'tokens' or 'spans'.")
+        encoding = self._tokenize(context, answer)
+        (probabilities,) = self._forward([encoding])
+        return self._decode(encoding, probabilities, output_format)
+
     def predict_prompt(self, prompt: str, answer: str, output_format: str = "tokens") -> list:
         """Predict hallucination tokens or spans from the provided prompt and answer.
 
@@ -201,6 +350,56 @@ class TransformerDetector(BaseDetector):
         prompt = self._form_prompt(context, question)
         return self._predict(prompt, answer, output_format)
 
+    def predict_batch(
+        self,
+        contexts: list[list[str]],
+        answers: list[str],
+        questions: list[str | None] | None = None,
+        output_format: str = "tokens",
+    ) -> list[list]:
+        """Predict hallucination tokens or spans for a batch of inputs with a single forward pass.
+
+        :param contexts: A list with a list of context strings for each input.
+        :param answers: A list with the answer string of each input.
+        :param questions: A list with the question string of each input.
+        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        :return: A list with the predictions of each input, in the same order as the inputs.
+        """
+        if questions is None:
+            questions = [None] * len(answers)
+        encodings = [
+            self.tokenize(context, answer, question)
+            for context, question, answer in zip(contexts, questions, answers)
+        ]
+        return self.predict_tokenized(encodings, output_format)
+
+    def tokenize(self, context: list[str], answer: str, question: str | None = None) -> dict:
+        """Tokenize the provided context, answer, and question for `predict_tokenized`.
+
+        :param context: A list of context strings.
+        :param answer: The answer string.
+        :param question: The question string.
+        :return: The encoding of the input.
+        """
+        return self._tokenize(self._form_prompt(context, question), answer)
+
+    def predict_tokenized(self, encodings: list[dict], output_format: str = "tokens") -> list[list]:
+        """Predict hallucination tokens or spans for a batch of tokenized inputs with a single forward pass.
+
+        :param encodings: A list of encodings as returned by `tokenize`.
+        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        :return: A list with the predictions of each input, in the same order as the inputs.
+        """
+        if output_format not in ("tokens", "spans"):
+            raise ValueError("Invalid output_format. Use 'tokens' or 'spans'.")
+        if not encodings:
+            return []
+        probabilities = self._forward(encodings)
+        return [
+            self._decode(encoding, probs, output_format)
+            for encoding, probs in zip(encodings, probabilities)
+        ]
+
 
 class HallucinationDetector:
     def __init__(self, method: str = "transformer", **kwargs):
@@ -230,6 +429,47 @@ class HallucinationDetector:
         """
         return self.detector.predict(context, answer, question, output_format)
 
+    def predict_batch(
+        self,
+        contexts: list[list[str]],
+        answers: list[str],
+        questions: list[str | None] | None = None,
+        output_format: str = "tokens",
+    ) -> list[list]:
+        """Predict hallucination tokens or spans for a batch of inputs.
+
+        Batching several inputs into a single forward pass is considerably faster than predicting them one by one, especially on GPUs.
+
+        :param contexts: A list with a list of context strings for each input.
+        :param answers: A list with the answer string of each input.
+        :param questions: A list with the question string of each input.
+        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        """
+        return self.detector.predict_batch(contexts, answers, questions, output_format)
+
+    def tokenize(self, context: list[str], answer: str, question: str | None = None) -> dict:
+        """Tokenize the provided context, answer, and question for `predict_tokenized`.
+
+        :param context: A list of context strings.
+        :param answer: The answer string.
+        :param question: The question string.
+        """
+        return self.detector.tokenize(context, answer, question)
+
+    def predict_tokenized(self, encodings: list[dict], output_format: str = "tokens") -> list[list]:
+        """Predict hallucination tokens or spans for a batch of tokenized inputs.
+
+        Separating the tokenization from the prediction allows to tokenize new inputs on the CPU while the model predicts another batch.
+
+        :param encodings: A list of encodings as returned by `tokenize`.
+        :param output_format: "tokens" to return token-level predictions, or "spans" to return grouped spans.
+        """
+        return self.detector.predict_tokenized(encodings, output_format)
+
+    def warmup(self) -> None:
+        """Run a forward pass with a dummy input, e.g. to compile the model before the first prediction."""
+        self.detector.warmup()
+
     def predict_prompt(self, prompt: str, answer: str, output_format: str = "tokens") -> list:
         """Predict hallucination tokens or spans from the provided prompt and answer.
 
@@ -0,0 +1,151 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, TypeVar
+
+from fastapi.concurrency import run_in_threadpool
+
+from lettucedetect.models.inference import HallucinationDetector
+
+T = TypeVar("T")
+
+
+@dataclass
+class _BatchItem:
+    encoding: dict
+    output_format: str
+    future: asyncio.Future
+
+
+class DetectionBatcher:
+    """Micro-batcher for concurrent hallucination detection requests.
+
+    Requests are tokenized in the threadpool and put into a queue. Background
+    workers collect the pending requests for up to `batch_window_ms`
+    milliseconds (or until `max_batch_size` requests are collected) and run them
+    through the detector in a single forward pass. The tokenization is not
+    limited by the workers, so new requests are tokenized while the model
+    predicts a batch. With more than one worker, the CPU work of one batch (e.g.
+    decoding the predictions) overlaps with the forward pass of another batch.
+
+    The batches are run in the threadpool, or on a single dedicated thread if
+    `dedicated_thread` is set. Models compiled with CUDA graphs keep their
+    recorded graphs per thread, so they have to use the dedicated thread.
+    """
+
+    def __init__(
+        self,
+        detector: HallucinationDetector,
+        max_batch_size: int = 8,
+        batch_window_ms: float = 5.0,
+        max_concurrent_batches: int = 1,
+        dedicated_thread: bool = False,
+    ):
+        """Initialize the batcher.
+
+        :param detector: The hallucination detector used for the predictions.
+        :param max_batch_size: Maximum number of requests per forward pass.
+        :param batch_window_ms: Time in milliseconds to wait for further
+        requests after the first request of a batch arrived.
+        :param max_concurrent_batches: Maximum number of batches run by the
+        detector at the same time. Use 1 to run only a single batch at a time,
+        higher values require the model to fit into memory several times.
+        :param dedicated_thread: Run all batches and `warmup` on a single
+        dedicated thread instead of the threadpool, e.g. for compiled models.
+        Requires `max_concurrent_batches=1`.
+        """
+        if dedicated_thread and max_concurrent_batches != 1:
+            raise ValueError("A dedicated thread requires max_concurrent_batches=1.")
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.batch_window_ms = batch_window_ms
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue: asyncio.Queue[_BatchItem] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._executor = ThreadPoolExecutor(max_workers=1) if dedicated_thread else None
+
+    def start(self) -> None:
+        """Start the background workers. Must be called from a running event loop."""
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.max_concurrent_batches)]
+
+    async def stop(self) -> None:
+        """Stop the background workers."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def warmup(self) -> None:
+        """Run the warmup of the detector on the thread which runs the batches."""
+        await self._run_detector(self.detector.warmup)
+
+    async def predict(
+        self, contexts: list[str], question: str, answer: str, output_format: str
+    ) -> list:
+        """Queue a request and wait for its predictions.
+
+        :param contexts: A list of context strings.
+        :param question: The question string.
+        :param answer: The answer string.
+        :param output_format: "tokens" or "spans", see `HallucinationDetector.predict`.
+        :return: The predictions of the detector for this request.
+        """
+        encoding = await run_in_threadpool(self.detector.tokenize, contexts, answer, question)
+        future = asyncio.get_running_loop().create_future()
+        item = _BatchItem(encoding, output_format, future)
+        await self._queue.put(item)
+        return await item.future
+
+    async def _run_detector(self, func: Callable[..., T], *args: object) -> T:
+        if self._executor is None:
+            return await run_in_threadpool(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            await self._process_batch(batch)
+
+    async def _collect_batch(self) -> list[_BatchItem]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window_ms / 1000
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            # Use asyncio.wait instead of asyncio.wait_for: cancelling a pending
+            # queue.get() never drops an item from the queue.
+            getter = asyncio.ensure_future(self._queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if not done:
+                getter.cancel()
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def _process_batch(self, batch: list[_BatchItem]) -> None:
+        # Requests may have been cancelled (e.g. client disconnected) while queued.
+        batch = [item for item in batch if not item.future.done()]
+        output_formats = {item.output_format for item in batch}
+        for output_format in output_formats:
+            items = [item for item in batch if item.output_format == output_format]
+            try:
+                preds = await self._run_detector(
+                    self.detector.predict_tokenized,
+                    [item.encoding for item in items],
+                    output_format,
+                )
+            except Exception as e:
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+            for item, item_preds in zip(items, preds):
+                if not item.future.done():
+                    item.future.set_result(item_preds)
@@ -1,13 +1,30 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from types import TracebackType
 from typing import Type, TypeVar
-from urllib.parse import urljoin
 
 import httpx
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 from lettucedetect_api.models import DetectionRequest, SpanDetectionResponse, TokenDetectionResponse
 
 T = TypeVar("T", bound=BaseModel)
 
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Sync transports (connection pools) shared by all `LettuceClient` instances
+# with the same connection limits, see `_get_shared_transport`.
+_SHARED_TRANSPORTS: dict[tuple, httpx.HTTPTransport] = {}
+_SHARED_TRANSPORTS_LOCK = threading.Lock()
+
+_TOKEN_ADAPTER = TypeAdapter(TokenDetectionResponse)
+_SPAN_ADAPTER = TypeAdapter(SpanDetectionResponse)
+_RESPONSE_ADAPTERS: dict[type[BaseModel], TypeAdapter] = {
+    TokenDetectionResponse: _TOKEN_ADAPTER,
+    SpanDetectionResponse: _SPAN_ADAPTER,
+}
+
 
 class InvalidRequestError(Exception):
     """Raised for invalid requests by the client."""
@@ -28,33 +45,122 @@ def _create_request_safe(contexts: list[str], question: str, answer: str) -> Det
         raise InvalidRequestError from e
 
 
+def _get_shared_transport(limits: httpx.Limits) -> httpx.HTTPTransport:
+    key = (limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry)
+    with _SHARED_TRANSPORTS_LOCK:
+        transport = _SHARED_TRANSPORTS.get(key)
+        if transport is None:
+            transport = httpx.HTTPTransport(limits=limits)
+            _SHARED_TRANSPORTS[key] = transport
+    return transport
+
+
+class _ETagCache:
+    """Thread-safe LRU cache of response bodies and their ETags.
+
+    The cache is keyed on the endpoint and request body. The cached ETag is sent
+    in the `If-None-Match` header and the cached body is reused if the server
+    responds with `304 Not Modified`.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[str, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, url: str, body: str) -> tuple[bytes, tuple[str, bytes] | None]:
+        key = hashlib.blake2b(f"{url}\n{body}".encode()).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return key, entry
+
+    def store(self, key: bytes, etag: str, content: bytes) -> None:
+        with self._lock:
+            self._entries[key] = (etag, content)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+def _prepare_request(
+    url: str, request: BaseModel, etag_cache: _ETagCache | None
+) -> tuple[str, dict[str, str], bytes | None, tuple[str, bytes] | None]:
+    body = request.model_dump_json()
+    if etag_cache is None:
+        return body, _JSON_HEADERS, None, None
+    key, entry = etag_cache.lookup(url, body)
+    if entry is None:
+        return body, _JSON_HEADERS, key, None
+    return body, {**_JSON_HEADERS, "If-None-Match": entry[0]}, key, entry
+
+
+def _store_response(
+    response: httpx.Response, content: bytes, etag_cache: _ETagCache | None, key: bytes | None
+) -> None:
+    etag = response.headers.get("ETag")
+    if etag_cache is not None and etag is not None:
+        etag_cache.store(key, etag, content)
+
+
+def _not_modified_content(entry: tuple[str, bytes] | None) -> bytes:
+    # 304 Not Modified is only valid as answer to the ETag of a cached response.
+    if entry is None:
+        raise InvalidResponseError(
+            "Server responded with 304 Not Modified to an unconditional request."
+        )
+    return entry[1]
+
+
+def _parse_response(content: bytes, response_model: Type[T]) -> T:
+    try:
+        return _RESPONSE_ADAPTERS[response_model].validate_json(content)
+    except ValidationError as e:
+        raise InvalidResponseError from e
+
+
 def _httpx_request_wrapper(
+    client: httpx.Client,
     method: str,
     url: str,
     request: BaseModel,
     response_model: Type[T],
+    etag_cache: _ETagCache | None = None,
 ) -> T:
+    body, headers, key, entry = _prepare_request(url, request, etag_cache)
+    # Stream the response so only the raw body bytes are buffered before they
+    # are handed to pydantic-core.
     try:
-        response = httpx.request(method, url, json=dict(request))
-        response.raise_for_status()
+        with client.stream(method, url, content=body, headers=headers) as response:
+            if response.status_code == 304:
+                content = _not_modified_content(entry)
+            else:
+                response.raise_for_status()
+                content = response.read()
+                _store_response(response, content, etag_cache, key)
     except httpx.HTTPError as e:
         raise HTTPError from e
-    try:
-        return response_model.model_validate_json(response.text)
-    except ValidationError as e:
-        raise InvalidResponseError from e
+    return _parse_response(content, response_model)
 
 
 async def _httpx_request_wrapper_async(
+    client: httpx.AsyncClient,
     method: str,
     url: str,
     request: BaseModel,
     response_model: Type[T],
+    etag_cache: _ETagCache | None = None,
 ) -> T:
-    async with httpx.AsyncClient() as client:
-        response = await client.request(method, url, json=dict(request))
-    response.raise_for_status()
-    return response_model.model_validate_json(response.text)
+    body, headers, key, entry = _prepare_request(url, request, etag_cache)
+    async with client.stream(method, url, content=body, headers=headers) as response:
+        if response.status_code == 304:
+            content = _not_modified_content(entry)
+        else:
+            response.raise_for_status()
+            content = await response.aread()
+            _store_response(response, content, etag_cache, key)
+    return _parse_response(content, response_model)
 
 
 class LettuceClientBase:
@@ -63,17 +169,88 @@ class LettuceClientBase:
     _TOKEN_ENDPOINT = "/v1/lettucedetect/token"  # noqa: S105
     _SPANS_ENDPOINT = "/v1/lettucedetect/spans"
 
-    def __init__(self, base_url: str):
+    def __init__(
+        self,
+        base_url: str,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 5.0,
+        etag_cache_size: int = 128,
+    ):
         """Initialize lettucedetect client sub-classes.
 
+        The clients keep a pool of HTTP connections alive between requests, so
+        reuse a single client instance instead of creating one per request.
+
         :param base_url: The full URL of the lettucedetect web server as a
         string. For a local server on port 8000 use "http://127.0.0.1:8000".
+        :param max_keepalive_connections: Maximum number of idle connections
+        kept in the connection pool. `None` means no limit.
+        :param keepalive_expiry: Time in seconds after which idle connections
+        are closed. `None` means idle connections are never closed.
+        :param etag_cache_size: Number of responses kept for HTTP conditional
+        requests. Repeated requests send the ETag of the cached response and the
+        server answers with `304 Not Modified` instead of running the detection
+        again. Use 0 to disable.
         """
         self.base_url = base_url
+        self._etag_cache = _ETagCache(etag_cache_size) if etag_cache_size > 0 else None
+        self._limits = httpx.Limits(
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
 
 
 class LettuceClient(LettuceClientBase):
-    """Synchronous client class for lettucedetect web API."""
+    """Synchronous client class for lettucedetect web API.
+
+    By default, all clients with the same connection limits share one
+    process-wide connection pool. Can be used as a context manager to close the
+    client on exit.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 5.0,
+        etag_cache_size: int = 128,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        """Initialize synchronous lettucedetect client.
+
+        See `LettuceClientBase` for a description of the other parameters.
+
+        :param transport: Custom httpx transport used instead of the shared
+        connection pool, e.g. for testing. The connection limits are ignored if
+        set. The transport is closed together with the client.
+        """
+        super().__init__(base_url, max_keepalive_connections, keepalive_expiry, etag_cache_size)
+        self._owns_transport = transport is not None
+        if transport is None:
+            transport = _get_shared_transport(self._limits)
+        self._client = httpx.Client(base_url=base_url, transport=transport)
+
+    def close(self) -> None:
+        """Close the client.
+
+        The shared connection pool is kept open for other clients, only a
+        custom transport passed to the client is closed.
+        """
+        if self._owns_transport:
+            self._client.close()
+
+    def __enter__(self) -> "LettuceClient":
+        """Enter the context manager and return the client."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Exit the context manager and close the client."""
+        self.close()
 
     def detect_token(
         self, contexts: list[str], question: str, answer: str
@@ -99,8 +276,14 @@ class LettuceClient(LettuceClientBase):
         compatible.
         """
         request = _create_request_safe(contexts=contexts, question=question, answer=answer)
-        url = urljoin(self.base_url, self._TOKEN_ENDPOINT)
-        return _httpx_request_wrapper("post", url, request, TokenDetectionResponse)
+        return _httpx_request_wrapper(
+            self._client,
+            "post",
+            self._TOKEN_ENDPOINT,
+            request,
+            TokenDetectionResponse,
+            self._etag_cache,
+        )
 
     def detect_spans(
         self, contexts: list[str], question: str, answer: str
@@ -126,12 +309,70 @@ class LettuceClient(LettuceClientBase):
         compatible.
         """
         request = _create_request_safe(contexts=contexts, question=question, answer=answer)
-        url = urljoin(self.base_url, self._SPANS_ENDPOINT)
-        return _httpx_request_wrapper("post", url, request, SpanDetectionResponse)
+        return _httpx_request_wrapper(
+            self._client,
+            "post",
+            self._SPANS_ENDPOINT,
+            request,
+            SpanDetectionResponse,
+            self._etag_cache,
+        )
 
 
 class LettuceClientAsync(LettuceClientBase):
-    """Asynchronous client class for lettucedetect web API."""
+    """Asynchronous client class for lettucedetect web API.
+
+    Can be used as an async context manager to close the connection pool on
+    exit.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_keepalive_connections: int | None = 20,
+        keepalive_expiry: float | None = 5.0,
+        etag_cache_size: int = 128,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        """Initialize asynchronous lettucedetect client.
+
+        See `LettuceClientBase` for a description of the other parameters.
+
+        :param transport: Custom httpx transport, e.g. for testing. The
+        connection limits are ignored if set. The transport is closed together
+        with the client.
+        """
+        super().__init__(base_url, max_keepalive_connections, keepalive_expiry, etag_cache_size)
+        self._transport = transport
+        self._aclient: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created lazily on first use so the connection pool is bound to the
+        # event loop the client is actually used in.
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                base_url=self.base_url, limits=self._limits, transport=self._transport
+            )
+        return self._aclient
+
+    async def aclose(self) -> None:
+        """Close all pooled connections of this client."""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+
+    async def __aenter__(self) -> "LettuceClientAsync":
+        """Enter the async context manager and return the client."""
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Exit the async context manager and close the client."""
+        await self.aclose()
 
     async def detect_token(
         self, contexts: list[str], question: str, answer: str
@@ -157,8 +398,14 @@ class LettuceClientAsync(LettuceClientBase):
         compatible.
         """
         request = _create_request_safe(contexts=contexts, question=question, answer=answer)
-        url = urljoin(self.base_url, self._TOKEN_ENDPOINT)
-        return await _httpx_request_wrapper_async("post", url, request, TokenDetectionResponse)
+        return await _httpx_request_wrapper_async(
+            self._get_client(),
+            "post",
+            self._TOKEN_ENDPOINT,
+            request,
+            TokenDetectionResponse,
+            self._etag_cache,
+        )
 
     async def detect_spans(
         self, contexts: list[str], question: str, answer: str
@@ -184,5 +431,11 @@ class LettuceClientAsync(LettuceClientBase):
         compatible.
         """
         request = _create_request_safe(contexts=contexts, question=question, answer=answer)
-        url = urljoin(self.base_url, self._SPANS_ENDPOINT)
-        return await _httpx_request_wrapper_async("post", url, request, SpanDetectionResponse)
+        return await _httpx_request_wrapper_async(
+            self._get_client(),
+            "post",
+            self._SPANS_ENDPOINT,
+            request,
+            SpanDetectionResponse,
+            self._etag_cache,
+        )
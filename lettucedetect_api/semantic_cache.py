@@ -0,0 +1,111 @@
+import hashlib
+
+import torch
+from cachetools import TTLCache
+from transformers import AutoModel, AutoTokenizer
+
+
+class SemanticCache:
+    """Cache for predictions of requests with similar contexts and question.
+
+    The predictions of the detector refer to the tokens of the answer, so a
+    cached prediction is only reused if the answer matches exactly. The question
+    and each context of the request are embedded separately with a sentence
+    embedding model, texts longer than the window of the model are split into
+    several windows. A cached prediction is returned if the request has the
+    same number of windows as a cached request with the same answer and the
+    cosine similarity of every window is at least `threshold`.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        threshold: float = 0.97,
+        maxsize: int = 10_000,
+        ttl: float = 3600.0,
+        max_entries_per_answer: int = 16,
+        device: torch.device | None = None,
+    ):
+        """Initialize the semantic cache.
+
+        :param model_path: Path or huggingface URL of the sentence embedding
+        model, e.g. "sentence-transformers/all-MiniLM-L6-v2".
+        :param threshold: Minimum cosine similarity for a cache hit.
+        :param maxsize: Maximum number of distinct answers in the cache.
+        :param ttl: Time in seconds after which cached answers expire.
+        :param max_entries_per_answer: Maximum number of cached requests for
+        the same answer. The oldest entry is dropped when the limit is reached.
+        :param device: The device to run the embedding model on.
+        """
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModel.from_pretrained(model_path)
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.model.to(self.device)
+        self.model.eval()
+        self.max_length = min(
+            self.tokenizer.model_max_length, self.model.config.max_position_embeddings
+        )
+        self.threshold = threshold
+        self.max_entries_per_answer = max_entries_per_answer
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def embed(self, contexts: list[str], question: str) -> torch.Tensor:
+        """Embed the question and contexts of a request.
+
+        :param contexts: A list of context strings.
+        :param question: The question string.
+        :return: The normalized embeddings (shape [num_windows, hidden_size])
+        of all windows of the question and contexts on the CPU.
+        """
+        encoding = self.tokenizer(
+            [question, *contexts],
+            truncation=True,
+            max_length=self.max_length,
+            return_overflowing_tokens=True,
+            padding=True,
+            return_tensors="pt",
+        )
+        attention_mask = encoding["attention_mask"].to(self.device)
+        with torch.inference_mode():
+            hidden_states = self.model(
+                input_ids=encoding["input_ids"].to(self.device), attention_mask=attention_mask
+            ).last_hidden_state
+        # Mean pooling over the tokens of each window, without padding.
+        mask = attention_mask.unsqueeze(-1).to(hidden_states.dtype)
+        embeddings = ((hidden_states * mask).sum(dim=1) / mask.sum(dim=1)).float().cpu()
+        return torch.nn.functional.normalize(embeddings, dim=-1)
+
+    def lookup(self, embedding: torch.Tensor, answer: str, output_format: str) -> list | None:
+        """Return the cached predictions of the most similar request or `None`.
+
+        :param embedding: The embeddings of the request as returned by `embed`.
+        :param answer: The answer string.
+        :param output_format: "tokens" or "spans".
+        """
+        best_similarity, best_preds = self.threshold, None
+        for cached, preds in self._entries.get(self._key(answer, output_format), []):
+            if cached.shape != embedding.shape:
+                continue
+            # The least similar window decides whether the requests match.
+            similarity = (cached * embedding).sum(dim=-1).min().item()
+            if similarity >= best_similarity:
+                best_similarity, best_preds = similarity, preds
+        return best_preds
+
+    def add(self, embedding: torch.Tensor, answer: str, output_format: str, preds: list) -> None:
+        """Add the predictions of a request to the cache.
+
+        :param embedding: The embeddings of the request as returned by `embed`.
+        :param answer: The answer string.
+        :param output_format: "tokens" or "spans".
+        :param preds: The predictions of the detector for the request.
+        """
+        key = self._key(answer, output_format)
+        entries = self._entries.get(key, [])
+        keep = max(len(entries) - self.max_entries_per_answer + 1, 0)
+        entries = [*entries[keep:], (embedding, preds)]
+        self._entries[key] = entries
+
+    @staticmethod
+    def _key(answer: str, output_format: str) -> bytes:
+        return hashlib.blake2b(f"{output_format}\n{answer}".encode()).digest()
@@ -1,13 +1,23 @@
-import asyncio
+import hashlib
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import AsyncIterator, Awaitable, Callable
 
-from fastapi import FastAPI
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic_core import from_json, to_json
 from pydantic_settings import BaseSettings
 
 from lettucedetect.models.inference import HallucinationDetector
-from lettucedetect_api.models import DetectionRequest, SpanDetectionResponse, TokenDetectionResponse
+from lettucedetect_api.batcher import DetectionBatcher
+from lettucedetect_api.models import (
+    DetectionRequest,
+    SpanDetectionResponse,
+    TokenDetectionResponse,
+)
+from lettucedetect_api.semantic_cache import SemanticCache
 
 
 class Settings(BaseSettings):
@@ -20,10 +30,76 @@ class Settings(BaseSettings):
 
     lettucedetect_model: str = "KRLabsOrg/lettucedect-base-modernbert-en-v1"
     lettucedetect_method: str = "transformer"
+    lettucedetect_dtype: str = "auto"
+    lettucedetect_quantize: bool = False
+    lettucedetect_compile: bool = False
+    lettucedetect_max_batch_size: int = 8
+    lettucedetect_batch_window_ms: float = 5.0
+    lettucedetect_max_concurrent_batches: int = 1
+    lettucedetect_max_request_bytes: int | None = None
+    lettucedetect_max_contexts: int | None = None
+    lettucedetect_cache_size: int = 10_000
+    lettucedetect_cache_ttl: float = 3600.0
+    lettucedetect_semantic_cache_model: str | None = None
+    lettucedetect_semantic_cache_threshold: float = 0.97
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response serialized with the pydantic-core JSON encoder.
+
+    Faster than the stdlib `json` encoder used by the default `JSONResponse`,
+    especially for the long prediction lists of token-level detection.
+    """
+
+    def render(self, content: object) -> bytes:
+        """Serialize `content` to JSON bytes."""
+        return to_json(content)
+
+
+class DetectionRoute(APIRoute):
+    """Route class which rejects too large detection requests early.
+
+    The limits are checked on the raw request body before the request is fully
+    parsed and validated by pydantic. The number of contexts is read with a
+    cheap JSON parse of the body (no model validation).
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Awaitable[Response]]:
+        """Wrap the default route handler with the request limit checks."""
+        route_handler = super().get_route_handler()
+
+        async def detection_route_handler(request: Request) -> Response:
+            # The body is cached by the request object and reused by the
+            # default route handler.
+            _check_request_limits(await request.body())
+            return await route_handler(request)
+
+        return detection_route_handler
+
+
+def _check_request_limits(body: bytes) -> None:
+    max_request_bytes = settings.lettucedetect_max_request_bytes
+    if max_request_bytes is not None and len(body) > max_request_bytes:
+        raise HTTPException(
+            status_code=413, detail=f"Request body exceeds {max_request_bytes} bytes."
+        )
+    max_contexts = settings.lettucedetect_max_contexts
+    if max_contexts is not None:
+        try:
+            data = from_json(body)
+        except ValueError:
+            # Invalid JSON, leave the error reporting to the request validation.
+            return
+        contexts = data.get("contexts") if isinstance(data, dict) else None
+        if isinstance(contexts, list) and len(contexts) > max_contexts:
+            raise HTTPException(status_code=422, detail=f"Request exceeds {max_contexts} contexts.")
 
 
 settings = Settings()
 detector: HallucinationDetector | None = None
+batcher: DetectionBatcher | None = None
+prediction_cache: TTLCache | None = None
+semantic_cache: SemanticCache | None = None
 
 
 @asynccontextmanager
@@ -33,57 +109,172 @@ async def init_detector(app: FastAPI) -> AsyncIterator[None]:
     This fastapi livespan event is run once during fastapi startup. It is used
     to load and initialize the hallucination detector. All subsequent requests
     can then use the hallucination detector without repeating the initialization
-    steps over and over again.
+    steps over and over again. It also starts the batcher which collects
+    concurrent requests into batches for the detector and creates the caches for
+    the predictions.
 
     :param app: The FastAPI object for this livespan event.
     """
-    global detector
+    global detector, batcher, prediction_cache, semantic_cache
     detector = HallucinationDetector(
         method=settings.lettucedetect_method,
         model_path=settings.lettucedetect_model,
+        dtype=settings.lettucedetect_dtype,
+        quantize=settings.lettucedetect_quantize,
+        compile=settings.lettucedetect_compile,
+    )
+    batcher = DetectionBatcher(
+        detector,
+        max_batch_size=settings.lettucedetect_max_batch_size,
+        batch_window_ms=settings.lettucedetect_batch_window_ms,
+        max_concurrent_batches=settings.lettucedetect_max_concurrent_batches,
+        dedicated_thread=settings.lettucedetect_compile,
     )
+    if settings.lettucedetect_compile:
+        # Compile the model now instead of during the first request.
+        await batcher.warmup()
+    batcher.start()
+    if settings.lettucedetect_cache_size > 0:
+        prediction_cache = TTLCache(
+            maxsize=settings.lettucedetect_cache_size, ttl=settings.lettucedetect_cache_ttl
+        )
+    if settings.lettucedetect_semantic_cache_model is not None:
+        semantic_cache = SemanticCache(
+            settings.lettucedetect_semantic_cache_model,
+            threshold=settings.lettucedetect_semantic_cache_threshold,
+            ttl=settings.lettucedetect_cache_ttl,
+        )
     yield
+    await batcher.stop()
+
 
+app = FastAPI(lifespan=init_detector, default_response_class=FastJSONResponse)
+app.router.route_class = DetectionRoute
 
-app = FastAPI(lifespan=init_detector)
-detector_lock = asyncio.Lock()
 
+def _cache_key(request: DetectionRequest, output_format: str) -> bytes:
+    data = to_json((request.contexts, request.question, request.answer, output_format))
+    return hashlib.blake2b(data).digest()
 
-async def run_detector_safe(request: DetectionRequest, output_format: str) -> dict:
-    """Run detector safely in a async environment without blocking."""
-    async with detector_lock:
-        preds = await run_in_threadpool(
-            detector.predict,
-            context=request.contexts,
-            question=request.question,
-            answer=request.answer,
-            output_format=output_format,
+
+def _etag(request: DetectionRequest, output_format: str) -> str:
+    # The predictions are fully determined by the model settings and the
+    # request, so the ETag can be computed without running the detector.
+    data = to_json(
+        (
+            settings.lettucedetect_model,
+            settings.lettucedetect_method,
+            settings.lettucedetect_dtype,
+            settings.lettucedetect_quantize,
+            settings.lettucedetect_compile,
+            request.contexts,
+            request.question,
+            request.answer,
+            output_format,
         )
+    )
+    return f'"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def _conditional_response(if_none_match: str | None, etag: str) -> Response | None:
+    # Only explicit ETags are answered with 304. "*" matches any existing
+    # resource, which fails the precondition for methods other than GET/HEAD
+    # (RFC 9110, section 13.1.2).
+    if if_none_match is None:
+        return None
+    etags = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    if "*" in etags:
+        return Response(status_code=412, headers=_cache_headers(etag))
+    if etag in etags:
+        return Response(status_code=304, headers=_cache_headers(etag))
+    return None
+
+
+def _cache_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": "private, max-age=0"}
+
+
+def _predictions_response(predictions: list[dict], etag: str) -> Response:
+    return FastJSONResponse(content={"predictions": predictions}, headers=_cache_headers(etag))
+
+
+async def run_detector_safe(request: DetectionRequest, output_format: str) -> list:
+    """Run detector safely in a async environment without blocking.
+
+    The request is batched together with other concurrent requests, see
+    `DetectionBatcher`. The predictions only depend on the request, so they are
+    cached and repeated requests are answered without running the detector. If
+    the semantic cache is enabled, requests with the same answer and similar
+    contexts and question are answered from the cache as well.
+    """
+    if prediction_cache is not None:
+        key = _cache_key(request, output_format)
+        preds = prediction_cache.get(key)
+        if preds is not None:
+            return preds
+    if semantic_cache is not None:
+        embedding = await run_in_threadpool(
+            semantic_cache.embed, request.contexts, request.question
+        )
+        preds = semantic_cache.lookup(embedding, request.answer, output_format)
+        if preds is not None:
+            return preds
+    preds = await batcher.predict(
+        contexts=request.contexts,
+        question=request.question,
+        answer=request.answer,
+        output_format=output_format,
+    )
+    if prediction_cache is not None:
+        prediction_cache[key] = preds
+    if semantic_cache is not None:
+        semantic_cache.add(embedding, request.answer, output_format, preds)
     return preds
 
 
+# The responses are serialized directly from the trusted detector output.
+# `response_model=None` skips the validation and serialization of the response
+# by FastAPI, `responses` still documents the response model in the OpenAPI
+# schema.
+# Requests with a matching `If-None-Match` header are answered with
+# `304 Not Modified` without running the detector, `If-None-Match: *` with
+# `412 Precondition Failed`.
 @app.post(
     "/v1/lettucedetect/token",
-    response_model=TokenDetectionResponse,
+    response_model=None,
+    responses={
+        200: {"model": TokenDetectionResponse},
+        304: {"description": "Not Modified"},
+        412: {"description": "Precondition Failed"},
+    },
     summary="Run token-level hallucination detection.",
 )
-async def run_token_detection(request: DetectionRequest) -> dict:
+async def run_token_detection(request: DetectionRequest, http_request: Request) -> Response:
     """Run token-level hallucination detection.
 
     Predicts hallucination scores for each token in `answer`. A higher score
     correlates to a higher probability that this token is hallucinated.
     """
+    etag = _etag(request, output_format="tokens")
+    conditional_response = _conditional_response(http_request.headers.get("if-none-match"), etag)
+    if conditional_response is not None:
+        return conditional_response
     preds = await run_detector_safe(request, output_format="tokens")
     preds_converted = [{"token": p["token"], "hallucination_score": p["prob"]} for p in preds]
-    return {"predictions": preds_converted}
+    return _predictions_response(preds_converted, etag)
 
 
 @app.post(
     "/v1/lettucedetect/spans",
-    response_model=SpanDetectionResponse,
+    response_model=None,
+    responses={
+        200: {"model": SpanDetectionResponse},
+        304: {"description": "Not Modified"},
+        412: {"description": "Precondition Failed"},
+    },
     summary="Run span-level hallucination detection.",
 )
-async def run_span_detection(request: DetectionRequest) -> dict:
+async def run_span_detection(request: DetectionRequest, http_request: Request) -> Response:
     """Run span-level hallucination detection.
 
     Predicts hallucination scores for spans of text in `answer`. A higher score
@@ -91,6 +282,10 @@ async def run_span_detection(request: DetectionRequest) -> dict:
     hallucination score of a span corresponds to the highest hallucination score
     of the tokens part of the span.
     """
+    etag = _etag(request, output_format="spans")
+    conditional_response = _conditional_response(http_request.headers.get("if-none-match"), etag)
+    if conditional_response is not None:
+        return conditional_response
     preds = await run_detector_safe(request, output_format="spans")
     preds_converted = [
         {
@@ -101,4 +296,4 @@ async def run_span_detection(request: DetectionRequest) -> dict:
         }
         for p in preds
     ]
-    return {"predictions": preds_converted}
+    return _predictions_response(preds_converted, etag)
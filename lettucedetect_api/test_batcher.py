@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from .batcher import DetectionBatcher
+
+
+def _tokenize(context: list[str], answer: str, question: str) -> dict:
+    return {"answer": answer}
+
+
+def _predict_tokenized(encodings: list[dict], output_format: str) -> list[list]:
+    return [
+        [{"answer": encoding["answer"], "output_format": output_format}] for encoding in encodings
+    ]
+
+
+def _mock_detector() -> MagicMock:
+    detector = MagicMock()
+    detector.tokenize.side_effect = _tokenize
+    detector.predict_tokenized.side_effect = _predict_tokenized
+    return detector
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_batched() -> None:
+    """Test that concurrent requests are run in a single detector call."""
+    detector = _mock_detector()
+    batcher = DetectionBatcher(detector, max_batch_size=8, batch_window_ms=50)
+    batcher.start()
+    try:
+        results = await asyncio.gather(
+            *[batcher.predict(["context"], "question", str(i), "tokens") for i in range(4)]
+        )
+    finally:
+        await batcher.stop()
+    assert detector.predict_tokenized.call_count == 1
+    assert [result[0]["answer"] for result in results] == ["0", "1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_batches_are_split_by_output_format() -> None:
+    """Test that token and span requests are predicted separately."""
+    detector = _mock_detector()
+    batcher = DetectionBatcher(detector, max_batch_size=8, batch_window_ms=50)
+    batcher.start()
+    try:
+        tokens, spans = await asyncio.gather(
+            batcher.predict(["context"], "question", "answer", "tokens"),
+            batcher.predict(["context"], "question", "answer", "spans"),
+        )
+    finally:
+        await batcher.stop()
+    assert detector.predict_tokenized.call_count == 2
+    assert tokens[0]["output_format"] == "tokens"
+    assert spans[0]["output_format"] == "spans"
+
+
+@pytest.mark.asyncio
+async def test_max_batch_size() -> None:
+    """Test that batches never exceed the maximum batch size."""
+    detector = _mock_detector()
+    batcher = DetectionBatcher(detector, max_batch_size=2, batch_window_ms=50)
+    batcher.start()
+    try:
+        await asyncio.gather(
+            *[batcher.predict(["context"], "question", str(i), "tokens") for i in range(5)]
+        )
+    finally:
+        await batcher.stop()
+    batch_sizes = [len(call.args[0]) for call in detector.predict_tokenized.call_args_list]
+    assert max(batch_sizes) <= 2
+    assert sum(batch_sizes) == 5
+
+
+@pytest.mark.asyncio
+async def test_detector_error_is_propagated() -> None:
+    """Test that detector errors are raised for every request of the batch."""
+    detector = _mock_detector()
+    detector.predict_tokenized.side_effect = RuntimeError("detector failed")
+    batcher = DetectionBatcher(detector, batch_window_ms=50)
+    batcher.start()
+    try:
+        with pytest.raises(RuntimeError):
+            await batcher.predict(["context"], "question", "answer", "tokens")
+    finally:
+        await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_max_concurrent_batches() -> None:
+    """Test that several batches run concurrently on the detector."""
+    running = 0
+    max_running = 0
+
+    def predict_tokenized(encodings: list[dict], output_format: str) -> list[list]:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        time.sleep(0.2)
+        running -= 1
+        return _predict_tokenized(encodings, output_format)
+
+    detector = _mock_detector()
+    detector.predict_tokenized.side_effect = predict_tokenized
+    batcher = DetectionBatcher(
+        detector, max_batch_size=1, batch_window_ms=0, max_concurrent_batches=2
+    )
+    batcher.start()
+    try:
+        await asyncio.gather(
+            *[batcher.predict(["context"], "question", str(i), "tokens") for i in range(4)]
+        )
+    finally:
+        await batcher.stop()
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_dedicated_thread() -> None:
+    """Test that the warmup and all batches run on the same dedicated thread."""
+    threads = set()
+
+    def predict_tokenized(encodings: list[dict], output_format: str) -> list[list]:
+        threads.add(threading.get_ident())
+        return _predict_tokenized(encodings, output_format)
+
+    detector = _mock_detector()
+    detector.warmup.side_effect = lambda: threads.add(threading.get_ident())
+    detector.predict_tokenized.side_effect = predict_tokenized
+    batcher = DetectionBatcher(detector, max_batch_size=1, dedicated_thread=True)
+    await batcher.warmup()
+    batcher.start()
+    try:
+        await asyncio.gather(
+            *[batcher.predict(["context"], "question", str(i), "tokens") for i in range(4)]
+        )
+    finally:
+        await batcher.stop()
+    assert detector.predict_tokenized.call_count == 4
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+
+
+def test_dedicated_thread_with_concurrent_batches() -> None:
+    """Test that a dedicated thread cannot run concurrent batches."""
+    with pytest.raises(ValueError):
+        DetectionBatcher(_mock_detector(), max_concurrent_batches=2, dedicated_thread=True)
@@ -2,10 +2,17 @@ import time
 from multiprocessing import Process
 from typing import Generator
 
+import httpx
 import pytest
 import uvicorn
 
-from .client import HTTPError, InvalidRequestError, LettuceClient, LettuceClientAsync
+from .client import (
+    HTTPError,
+    InvalidRequestError,
+    InvalidResponseError,
+    LettuceClient,
+    LettuceClientAsync,
+)
 from .models import SpanDetectionResponse, TokenDetectionResponse
 from .server import app
 
@@ -81,6 +88,80 @@ async def test_valid_span_level_request_async(lettuce_server: None) -> None:
     assert len(response.predictions) >= 1
 
 
+def test_client_context_manager(lettuce_server: None) -> None:
+    """Test reusing one client for multiple requests within a context manager."""
+    with LettuceClient(SERVER_URL) as client:
+        for _ in range(3):
+            response = client.detect_token(
+                contexts=["France is a country in Europe. The capital of France is Paris."],
+                question="What is the capital of France?",
+                answer="The capital of France is Paris.",
+            )
+            assert isinstance(response, TokenDetectionResponse)
+
+
+@pytest.mark.asyncio
+async def test_client_context_manager_async(lettuce_server: None) -> None:
+    """Test reusing one async client for multiple requests within a context manager."""
+    async with LettuceClientAsync(SERVER_URL) as client:
+        for _ in range(3):
+            response = await client.detect_spans(
+                contexts=["France is a country in Europe. The capital of France is Paris."],
+                question="What is the capital of France?",
+                answer="The capital of France is Paris.",
+            )
+            assert isinstance(response, SpanDetectionResponse)
+
+
+def test_clients_share_connection_pool(lettuce_server: None) -> None:
+    """Test that closing a client does not close the pool shared with other clients."""
+    with LettuceClient(SERVER_URL) as first:
+        first.detect_token(
+            contexts=["France is a country in Europe. The capital of France is Paris."],
+            question="What is the capital of France?",
+            answer="The capital of France is Paris.",
+        )
+    with LettuceClient(SERVER_URL) as second:
+        response = second.detect_token(
+            contexts=["France is a country in Europe. The capital of France is Paris."],
+            question="What is the capital of France?",
+            answer="The capital of France is Paris.",
+        )
+    assert first._client._transport is second._client._transport
+    assert isinstance(response, TokenDetectionResponse)
+
+
+def test_repeated_request_not_modified(lettuce_server: None) -> None:
+    """Test that repeated requests reuse the cached response on 304 Not Modified."""
+    status_codes = []
+    with LettuceClient(SERVER_URL) as client:
+        client._client.event_hooks["response"].append(
+            lambda response: status_codes.append(response.status_code)
+        )
+        responses = [
+            client.detect_spans(
+                contexts=["France is a country in Europe. The capital of France is Paris."],
+                question="What is the capital of France?",
+                answer="The capital of France is Paris.",
+            )
+            for _ in range(2)
+        ]
+    assert status_codes == [200, 304]
+    assert responses[0] == responses[1]
+
+
+def test_not_modified_without_cached_response() -> None:
+    """Test that a 304 response to a request without cached response is invalid."""
+    transport = httpx.MockTransport(lambda request: httpx.Response(304))
+    with LettuceClient(SERVER_URL, etag_cache_size=0, transport=transport) as client:
+        with pytest.raises(InvalidResponseError):
+            client.detect_token(
+                contexts=["France is a country in Europe. The capital of France is Paris."],
+                question="What is the capital of France?",
+                answer="The capital of France is Paris.",
+            )
+
+
 def test_empty_token_level_request(lettuce_server: None) -> None:
     """Test request with empty values for token level detection."""
     client = LettuceClient(SERVER_URL)
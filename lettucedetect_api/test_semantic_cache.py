@@ -0,0 +1,76 @@
+from typing import Generator
+from unittest.mock import MagicMock, patch
+
+import pytest
+import torch
+
+from .semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def semantic_cache() -> Generator[SemanticCache, None, None]:
+    """Create a semantic cache without loading an embedding model."""
+    tokenizer = MagicMock(model_max_length=512)
+    model = MagicMock()
+    model.config.max_position_embeddings = 512
+    with (
+        patch(
+            "lettucedetect_api.semantic_cache.AutoTokenizer.from_pretrained",
+            return_value=tokenizer,
+        ),
+        patch("lettucedetect_api.semantic_cache.AutoModel.from_pretrained", return_value=model),
+    ):
+        yield SemanticCache("dummy_path", threshold=0.9, max_entries_per_answer=2)
+
+
+def _embedding(*values: float) -> torch.Tensor:
+    # The embedding of a request with a single window.
+    return torch.nn.functional.normalize(torch.tensor([values]), dim=-1)
+
+
+def test_lookup_similar_request(semantic_cache: SemanticCache) -> None:
+    """Test that a similar request with the same answer is a cache hit."""
+    semantic_cache.add(_embedding(1.0, 0.0), "answer", "tokens", ["preds"])
+    assert semantic_cache.lookup(_embedding(1.0, 0.1), "answer", "tokens") == ["preds"]
+
+
+def test_lookup_dissimilar_request(semantic_cache: SemanticCache) -> None:
+    """Test that a dissimilar request is a cache miss."""
+    semantic_cache.add(_embedding(1.0, 0.0), "answer", "tokens", ["preds"])
+    assert semantic_cache.lookup(_embedding(0.0, 1.0), "answer", "tokens") is None
+
+
+def test_lookup_different_answer_or_format(semantic_cache: SemanticCache) -> None:
+    """Test that the answer and output format have to match exactly."""
+    semantic_cache.add(_embedding(1.0, 0.0), "answer", "tokens", ["preds"])
+    assert semantic_cache.lookup(_embedding(1.0, 0.0), "answer.", "tokens") is None
+    assert semantic_cache.lookup(_embedding(1.0, 0.0), "answer", "spans") is None
+
+
+def test_max_entries_per_answer(semantic_cache: SemanticCache) -> None:
+    """Test that the oldest entry of an answer is dropped when the limit is reached."""
+    semantic_cache.add(_embedding(1.0, 0.0), "answer", "tokens", ["first"])
+    semantic_cache.add(_embedding(0.0, 1.0), "answer", "tokens", ["second"])
+    semantic_cache.add(_embedding(-1.0, 0.0), "answer", "tokens", ["third"])
+    assert semantic_cache.lookup(_embedding(1.0, 0.0), "answer", "tokens") is None
+    assert semantic_cache.lookup(_embedding(0.0, 1.0), "answer", "tokens") == ["second"]
+    assert semantic_cache.lookup(_embedding(-1.0, 0.0), "answer", "tokens") == ["third"]
+
+
+def test_lookup_requires_every_window_to_match(semantic_cache: SemanticCache) -> None:
+    """Test that all windows of the request have to be similar for a cache hit."""
+    cached = torch.cat([_embedding(1.0, 0.0), _embedding(0.0, 1.0)])
+    semantic_cache.add(cached, "answer", "tokens", ["preds"])
+    assert semantic_cache.lookup(cached, "answer", "tokens") == ["preds"]
+    different_window = torch.cat([_embedding(1.0, 0.0), _embedding(1.0, 0.0)])
+    assert semantic_cache.lookup(different_window, "answer", "tokens") is None
+    assert semantic_cache.lookup(_embedding(1.0, 0.0), "answer", "tokens") is None
+
+
+def test_single_entry_per_answer(semantic_cache: SemanticCache) -> None:
+    """Test that only the latest entry is kept with `max_entries_per_answer=1`."""
+    semantic_cache.max_entries_per_answer = 1
+    for i in range(5):
+        semantic_cache.add(_embedding(1.0, float(i)), "answer", "tokens", [i])
+    (entry,) = semantic_cache._entries[semantic_cache._key("answer", "tokens")]
+    assert entry[1] == [4]
@@ -1,6 +1,11 @@
+from unittest.mock import patch
+
+import pytest
 from fastapi.testclient import TestClient
 
-from .server import app
+from . import server
+from .models import DetectionRequest
+from .server import app, settings
 
 TOKEN = "token"  # noqa: S105
 HALLUCINATION_SCORE = "hallucination_score"
@@ -105,3 +110,108 @@ def test_invalid_request_span_level_request() -> None:
     assert response.status_code == 422
     response_data = response.json()
     assert "detail" in response_data
+
+
+def test_too_many_contexts_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test request with more contexts than allowed."""
+    monkeypatch.setattr(settings, "lettucedetect_max_contexts", 1)
+    request = {
+        "contexts": ["France is a country in Europe.", "The capital of France is Paris."],
+        "question": "What is the capital of France?",
+        "answer": "The capital of France is Paris.",
+    }
+    with TestClient(app) as client:
+        response = client.post("/v1/lettucedetect/token", json=request)
+    assert response.status_code == 422
+    response_data = response.json()
+    assert "detail" in response_data
+
+
+def test_too_large_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test request with a body larger than allowed."""
+    monkeypatch.setattr(settings, "lettucedetect_max_request_bytes", 64)
+    request = {
+        "contexts": ["France is a country in Europe. The capital of France is Paris."],
+        "question": "What is the capital of France?",
+        "answer": "The capital of France is Paris.",
+    }
+    with TestClient(app) as client:
+        response = client.post("/v1/lettucedetect/spans", json=request)
+    assert response.status_code == 413
+    response_data = response.json()
+    assert "detail" in response_data
+
+
+def test_repeated_request_is_cached() -> None:
+    """Test that repeated requests are answered from the prediction cache."""
+    request = {
+        "contexts": ["France is a country in Europe. The capital of France is Paris."],
+        "question": "What is the capital of France?",
+        "answer": "The capital of France is Paris.",
+    }
+    with TestClient(app) as client:
+        with patch.object(server.batcher, "predict", wraps=server.batcher.predict) as predict:
+            first = client.post("/v1/lettucedetect/token", json=request)
+            second = client.post("/v1/lettucedetect/token", json=request)
+            spans = client.post("/v1/lettucedetect/spans", json=request)
+    assert first.status_code == second.status_code == spans.status_code == 200
+    assert first.json() == second.json()
+    assert predict.call_count == 2
+
+
+def test_conditional_request() -> None:
+    """Test that a request with matching If-None-Match header is not modified."""
+    request = {
+        "contexts": ["France is a country in Europe. The capital of France is Paris."],
+        "question": "What is the capital of France?",
+        "answer": "The capital of France is Paris.",
+    }
+    with TestClient(app) as client:
+        response = client.post("/v1/lettucedetect/spans", json=request)
+        etag = response.headers["ETag"]
+        with patch.object(server.batcher, "predict", wraps=server.batcher.predict) as predict:
+            not_modified = client.post(
+                "/v1/lettucedetect/spans", json=request, headers={"If-None-Match": etag}
+            )
+            other_format = client.post(
+                "/v1/lettucedetect/token", json=request, headers={"If-None-Match": etag}
+            )
+    assert response.status_code == 200
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.content == b""
+    assert other_format.status_code == 200
+    assert other_format.headers["ETag"] != etag
+    # Only the request with the other output format runs the detector.
+    assert predict.call_count == 1
+
+
+def test_conditional_request_with_wildcard() -> None:
+    """Test that `If-None-Match: *` fails the precondition of a detection request."""
+    request = {
+        "contexts": ["France is a country in Europe. The capital of France is Paris."],
+        "question": "What is the capital of France?",
+        "answer": "The capital of France is Paris.",
+    }
+    with TestClient(app) as client:
+        with patch.object(server.batcher, "predict", wraps=server.batcher.predict) as predict:
+            response = client.post(
+                "/v1/lettucedetect/token", json=request, headers={"If-None-Match": "*"}
+            )
+    assert response.status_code == 412
+    assert predict.call_count == 0
+
+
+def test_etag_depends_on_model_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the ETag changes with the settings which affect the predictions."""
+    request = DetectionRequest(
+        contexts=["France is a country in Europe. The capital of France is Paris."],
+        question="What is the capital of France?",
+        answer="The capital of France is Paris.",
+    )
+    etag = server._etag(request, "tokens")
+    monkeypatch.setattr(settings, "lettucedetect_dtype", "bfloat16")
+    assert server._etag(request, "tokens") != etag
+    monkeypatch.setattr(settings, "lettucedetect_quantize", True)
+    monkeypatch.setattr(settings, "lettucedetect_dtype", "auto")
+    assert server._etag(request, "tokens") != etag
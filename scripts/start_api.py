@@ -3,7 +3,9 @@
 import argparse
 import os
 import pathlib
-import subprocess
+import sys
+
+import uvicorn
 
 
 def _argparse() -> dict:
@@ -12,9 +14,10 @@ def _argparse() -> dict:
         "mode",
         help=(
             'Choose "dev" for development or "prod" for production environments. The serve script '
-            'uses "fastapi dev" for "dev" or "fastapi run" for "prod" to start the web server. '
-            'Additionally when choosing the "dev" mode, python modules can be directly imported '
-            "from the repositroy without installing the package."
+            'uses uvicorn with auto-reload for "dev" or uvicorn with uvloop, httptools and '
+            'multiple workers for "prod" to start the web server. Additionally when choosing the '
+            '"dev" mode, python modules can be directly imported from the repositroy without '
+            "installing the package."
         ),
         choices=["prod", "dev"],
     )
@@ -29,33 +32,74 @@ def _argparse() -> dict:
         choices=["transformer"],
         default="transformer",
     )
+    parser.add_argument(
+        "--host",
+        help=(
+            'Host to bind the web server to. The default value is "0.0.0.0" in "prod" mode and '
+            '"127.0.0.1" in "dev" mode.'
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--port",
+        help="Port to bind the web server to. The default value is 8000.",
+        type=int,
+        default=8000,
+    )
+    parser.add_argument(
+        "--workers",
+        help=(
+            'Number of worker processes in "prod" mode. Each worker loads its own copy of the '
+            'model. The default value is 1. Ignored in "dev" mode.'
+        ),
+        type=int,
+        default=1,
+    )
     return parser.parse_args()
 
 
-def _run_fastapi(args: dict) -> None:
+def _run_uvicorn(args: dict) -> None:
     scripts_folder = pathlib.Path(__file__).parent.resolve()
     repo_folder = scripts_folder.parent
-    api_folder = repo_folder / "lettucedetect_api"
-    env = os.environ.copy()
-    env["LETTUCEDETECT_MODEL"] = args.model
-    env["LETTUCEDETECT_METHOD"] = args.method
+    # The settings of the web server are read from environment variables.
+    os.environ["LETTUCEDETECT_MODEL"] = args.model
+    os.environ["LETTUCEDETECT_METHOD"] = args.method
+    if args.host is None:
+        # Same defaults as the "fastapi run" and "fastapi dev" commands.
+        args.host = "0.0.0.0" if args.mode == "prod" else "127.0.0.1"  # noqa: S104
     if args.mode == "dev":
-        # Needed for fastapi to be able to import directly from the repository.
-        env["PYTHONPATH"] = env.get("PYTHONPATH", "") + os.pathsep + str(repo_folder)
-        fastapi_cmd = ["fastapi", "dev", api_folder / "server.py"]
+        # Needed for uvicorn to be able to import directly from the repository,
+        # also in the reloader subprocess.
+        sys.path.insert(0, str(repo_folder))
+        os.environ["PYTHONPATH"] = os.environ.get("PYTHONPATH", "") + os.pathsep + str(repo_folder)
+        uvicorn.run(
+            "lettucedetect_api.server:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            reload_dirs=[
+                str(repo_folder / "lettucedetect"),
+                str(repo_folder / "lettucedetect_api"),
+            ],
+        )
     else:
-        fastapi_cmd = ["fastapi", "run", api_folder / "server.py"]
-    try:
-        # Ignore S603: Validate input to run method. False positive.
-        subprocess.run(fastapi_cmd, env=env, cwd=repo_folder)  # noqa: S603
-    except KeyboardInterrupt:
-        pass
+        # "auto" selects the faster uvloop event loop and httptools HTTP parser,
+        # which are installed with fastapi[standard] (uvloop is not available
+        # on Windows).
+        uvicorn.run(
+            "lettucedetect_api.server:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            loop="auto",
+            http="auto",
+        )
 
 
 def main() -> None:
     """Entry point for script."""
     args = _argparse()
-    _run_fastapi(args)
+    _run_uvicorn(args)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,12 @@
 """Pytest tests for the inference module."""
 
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
 
 import pytest
 import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, processors
+from transformers import PreTrainedTokenizerFast
 
 from lettucedetect.models.inference import HallucinationDetector, TransformerDetector
 
@@ -26,6 +29,25 @@ def mock_model():
     return model
 
 
+def _word_level_tokenizer() -> PreTrainedTokenizerFast:
+    """Create a small fast tokenizer which splits on whitespace."""
+    vocab = {"[UNK]": 0, "[CLS]": 1, "[SEP]": 2, "[PAD]": 3, "word": 4, "answer": 5}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        pair="[CLS] $A [SEP] $B [SEP]",
+        special_tokens=[("[CLS]", 1), ("[SEP]", 2)],
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="[UNK]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+        pad_token="[PAD]",
+    )
+
+
 class TestHallucinationDetector:
     """Tests for the HallucinationDetector class."""
 
@@ -65,6 +87,52 @@ class TestHallucinationDetector:
             assert call_args[2] == question
             assert call_args[3] == "tokens"
 
+    def test_predict_batch(self):
+        """Test predict_batch method."""
+        # Create a mock detector with the predict_batch method
+        mock_detector = MagicMock()
+        mock_detector.predict_batch.return_value = [[], []]
+
+        with patch(
+            "lettucedetect.models.inference.TransformerDetector", return_value=mock_detector
+        ):
+            detector = HallucinationDetector(method="transformer")
+            contexts = [["This is a test context."], ["This is another test context."]]
+            answers = ["This is a test answer.", "This is another test answer."]
+            questions = ["What is the test?", None]
+
+            result = detector.predict_batch(contexts, answers, questions)
+
+            # Check that the mock detector's predict_batch method was called with the correct arguments
+            mock_detector.predict_batch.assert_called_once()
+            call_args = mock_detector.predict_batch.call_args[0]
+            assert call_args[0] == contexts
+            assert call_args[1] == answers
+            assert call_args[2] == questions
+            assert call_args[3] == "tokens"
+            assert result == [[], []]
+
+    def test_tokenize_and_predict_tokenized(self):
+        """Test tokenize and predict_tokenized methods."""
+        mock_detector = MagicMock()
+        mock_detector.tokenize.return_value = {"input_ids": []}
+        mock_detector.predict_tokenized.return_value = [[]]
+
+        with patch(
+            "lettucedetect.models.inference.TransformerDetector", return_value=mock_detector
+        ):
+            detector = HallucinationDetector(method="transformer")
+            context = ["This is a test context."]
+            answer = "This is a test answer."
+            question = "What is the test?"
+
+            encoding = detector.tokenize(context, answer, question)
+            result = detector.predict_tokenized([encoding], output_format="spans")
+
+            mock_detector.tokenize.assert_called_once_with(context, answer, question)
+            mock_detector.predict_tokenized.assert_called_once_with([encoding], "spans")
+            assert result == [[]]
+
     def test_predict_prompt(self):
         """Test predict_prompt method."""
         # Create a mock detector with the predict_prompt method
@@ -125,6 +193,117 @@ class TestTransformerDetector:
         assert detector.model == self.mock_model
         assert detector.max_length == 4096
 
+    def test_init_with_dtype(self):
+        """Test initialization with a dtype."""
+        detector = TransformerDetector(
+            model_path="dummy_path", device=torch.device("cpu"), dtype="bfloat16"
+        )
+
+        self.mock_model.to.assert_called_once_with(device=torch.device("cpu"), dtype=torch.bfloat16)
+        assert detector.model == self.mock_model
+
+    def test_init_with_auto_dtype_on_cpu(self):
+        """Test that the auto dtype keeps float32 on the CPU."""
+        TransformerDetector(model_path="dummy_path", device=torch.device("cpu"), dtype="auto")
+
+        self.mock_model.to.assert_called_once_with(device=torch.device("cpu"), dtype=torch.float32)
+
+    def test_init_with_invalid_dtype(self):
+        """Test initialization with an invalid dtype."""
+        with pytest.raises(ValueError):
+            TransformerDetector(model_path="dummy_path", dtype="int3")
+
+    def test_init_with_quantization(self):
+        """Test initialization with dynamic int8 quantization."""
+        quantized_model = MagicMock()
+        with patch(
+            "lettucedetect.models.inference.quantize_dynamic", return_value=quantized_model
+        ) as mock_quantize:
+            detector = TransformerDetector(
+                model_path="dummy_path", device=torch.device("cpu"), quantize=True
+            )
+
+        mock_quantize.assert_called_once_with(self.mock_model, {torch.nn.Linear}, dtype=torch.qint8)
+        assert detector.model == quantized_model
+
+    def test_init_with_quantization_on_gpu(self):
+        """Test that quantization is rejected on GPUs."""
+        with pytest.raises(ValueError):
+            TransformerDetector(model_path="dummy_path", device=torch.device("cuda"), quantize=True)
+
+    def test_init_with_quantization_and_dtype(self):
+        """Test that quantization is rejected with reduced precision dtypes."""
+        with pytest.raises(ValueError):
+            TransformerDetector(
+                model_path="dummy_path",
+                device=torch.device("cpu"),
+                dtype="bfloat16",
+                quantize=True,
+            )
+
+    def test_init_with_compile(self):
+        """Test initialization with torch.compile."""
+        compiled_model = MagicMock()
+        with patch(
+            "lettucedetect.models.inference.torch.compile", return_value=compiled_model
+        ) as mock_compile:
+            detector = TransformerDetector(model_path="dummy_path", compile=True)
+
+        mock_compile.assert_called_once_with(
+            self.mock_model, mode="reduce-overhead", fullgraph=False
+        )
+        assert detector.model == compiled_model
+
+    def test_concurrent_tokenize(self):
+        """Test that tokenizing from several threads gives the same encodings as sequentially."""
+        detector = TransformerDetector(model_path="dummy_path", max_length=64)
+        detector.tokenizer = _word_level_tokenizer()
+        # Mix contexts which are truncated with contexts which are not.
+        inputs = [
+            (" ".join(["word"] * (10 if i % 2 else 200)), "answer answer") for i in range(4000)
+        ]
+        expected = {
+            context: detector._tokenize(context, answer)["answer_start_token"]
+            for context, answer in inputs[:2]
+        }
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            encodings = list(executor.map(lambda args: detector._tokenize(*args), inputs))
+
+        for (context, _), encoding in zip(inputs, encodings):
+            assert encoding["input_ids"].size(0) <= 64
+            assert encoding["answer_start_token"] == expected[context]
+
+    def test_padded_length(self):
+        """Test the padding of the sequence length."""
+        detector = TransformerDetector(model_path="dummy_path", max_length=1500)
+        assert detector._padded_length(100) == 104
+        assert detector._padded_length(1499) == 1500
+
+        detector.compiled = True
+        assert detector._padded_length(100) == 128
+        assert detector._padded_length(200) == 256
+        assert detector._padded_length(512) == 512
+        assert detector._padded_length(513) == 1024
+        assert detector._padded_length(1100) == 1500
+
+        detector = TransformerDetector(model_path="dummy_path")
+        detector.compiled = True
+        assert detector._padded_length(2048) == 2048
+        assert detector._padded_length(2049) == 4096
+        assert detector._padded_length(3000) == 4096
+
+    def test_padded_batch_size(self):
+        """Test that only compiled models are padded to the batch size buckets."""
+        detector = TransformerDetector(model_path="dummy_path")
+        assert detector._padded_batch_size(3) == 3
+
+        detector.compiled = True
+        assert detector._padded_batch_size(1) == 1
+        assert detector._padded_batch_size(3) == 4
+        assert detector._padded_batch_size(9) == 16
+        assert detector._padded_batch_size(40) == 40
+
     def test_predict(self):
         """Test predict method."""
 